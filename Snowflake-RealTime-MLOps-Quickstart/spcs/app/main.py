@@ -10,15 +10,27 @@ Customize:
 - calculate_risk_score(): Implement your scoring logic
 """
 
+import asyncio
+import io
 import os
 import re
+import threading
 import time
+from collections import OrderedDict
 from datetime import datetime
+from hashlib import blake2b
 from typing import Optional
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, BackgroundTasks
-from pydantic import BaseModel
+import httpx
+import msgspec
+from fastapi import FastAPI, BackgroundTasks, Request
+from fastapi.responses import ORJSONResponse
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None  # Regex fallback path is used instead
 
 # ============================================================================
 # CONFIGURATION
@@ -32,335 +44,770 @@ SNOWFLAKE_SCHEMA = os.getenv("SNOWFLAKE_SCHEMA", "FEATURE_STORE")
 USE_MODEL_REGISTRY = os.getenv("USE_MODEL_REGISTRY", "false").lower() == "true"
 MODEL_SERVICE_URL = os.getenv("MODEL_SERVICE_URL", "http://your-model-svc:5000/predict")
 
+# Echo the full per-row feature map in /predict responses. Snowflake's
+# FN_API_PREDICT has a fixed 3-arg signature and cannot set a payload
+# flag, so feature echo for SQL callers is enabled service-wide here
+# (set in the service spec env). Leave off in production - the echo
+# dominates response bytes and serialization time.
+ECHO_FEATURES = os.getenv("ECHO_FEATURES", "false").lower() == "true"
+
+# Pre-compiled XML patterns (compiled once at import, not per request)
+_MIB_RESPONSE_RE = re.compile(r'<ResponseData>([^<]+)</ResponseData>')
+_MIB_BMI_RE = re.compile(r'<BMI>(\d+\.?\d*)</BMI>')
+_RX_GENERIC_RE = re.compile(r'<DrugGenericName>([^<]+)</DrugGenericName>')
+_RX_SPECIALTY_RE = re.compile(r'<PhysicianSpecialty>([^<]+)</PhysicianSpecialty>')
+
+# Category keyword sets (customize for your schema / formulary).
+# Kept as module-level frozensets so each parse does cheap set lookups
+# instead of rebuilding the needle lists per call.
+_CARDIAC_CODES = frozenset({'CARDIAC', 'HEART', 'CVD'})
+_DIABETES_CODES = frozenset({'DIABETES', 'DM', 'INSULIN'})
+_CANCER_CODES = frozenset({'CANCER', 'TUMOR', 'MALIG'})
+_RESPIRATORY_CODES = frozenset({'COPD', 'ASTHMA', 'PULM'})
+_MENTAL_HEALTH_CODES = frozenset({'MENTAL', 'PSYCH', 'DEPRESS'})
+_SUBSTANCE_CODES = frozenset({'SUBSTANCE', 'ALCOHOL', 'DRUG'})
+
+_STATIN_DRUGS = frozenset({'STATIN', 'ATORVASTATIN', 'SIMVASTATIN'})
+_METFORMIN_DRUGS = frozenset({'METFORMIN'})
+_INSULIN_DRUGS = frozenset({'INSULIN'})
+_OPIOID_DRUGS = frozenset({'OXYCODONE', 'HYDROCODONE', 'MORPHINE', 'FENTANYL'})
+_BENZO_DRUGS = frozenset({'ALPRAZOLAM', 'DIAZEPAM', 'LORAZEPAM', 'CLONAZEPAM'})
+_ANTIDEPRESSANT_DRUGS = frozenset({'SERTRALINE', 'FLUOXETINE', 'ESCITALOPRAM'})
+_ANTIPSYCHOTIC_DRUGS = frozenset({'QUETIAPINE', 'RISPERIDONE', 'ARIPIPRAZOLE'})
+_BLOOD_THINNER_DRUGS = frozenset({'WARFARIN', 'ELIQUIS', 'XARELTO'})
+_GABAPENTIN_DRUGS = frozenset({'GABAPENTIN', 'PREGABALIN'})
+_SUBOXONE_DRUGS = frozenset({'SUBOXONE', 'BUPRENORPHINE'})
+
+
+def _build_category_scanner(categories: dict) -> tuple:
+    """
+    Build a one-pass multi-needle scanner from {category: needles}.
+
+    Returns (pattern, needle_map): pattern is a single alternation regex
+    matching every needle, needle_map resolves a matched needle back to
+    its category. The alternation sits inside a lookahead so matches
+    consume no text: a needle starting inside an earlier match is still
+    reported (plain finditer would swallow it), which keeps the results
+    identical to independent substring checks per needle. Longest-first
+    ordering still decides between needles starting at the same position.
+    """
+    needle_map = {}
+    for category, needles in categories.items():
+        for needle in needles:
+            needle_map[needle] = category
+    pattern = re.compile(
+        '(?=(' + '|'.join(sorted(needle_map, key=len, reverse=True)) + '))',
+        re.IGNORECASE)
+    return pattern, needle_map
+
+
+def _scan_categories(tokens, scanner: tuple) -> set:
+    """
+    Return the set of categories whose needles appear in the tokens.
+
+    Matching is case-insensitive in the pattern itself, so tokens are
+    scanned as extracted - only the short matched needle is uppercased
+    to key back into the needle map, never the payload text.
+    """
+    pattern, needle_map = scanner
+    hits = set()
+    for token in tokens:
+        for match in pattern.finditer(token):
+            hits.add(needle_map[match.group(1).upper()])
+    return hits
+
+
+_MIB_CODE_SCANNER = _build_category_scanner({
+    'cardiac': _CARDIAC_CODES,
+    'diabetes': _DIABETES_CODES,
+    'cancer': _CANCER_CODES,
+    'respiratory': _RESPIRATORY_CODES,
+    'mental_health': _MENTAL_HEALTH_CODES,
+    'substance_abuse': _SUBSTANCE_CODES,
+})
+
+_RX_DRUG_SCANNER = _build_category_scanner({
+    'statin': _STATIN_DRUGS,
+    'metformin': _METFORMIN_DRUGS,
+    'insulin': _INSULIN_DRUGS,
+    'opioid': _OPIOID_DRUGS,
+    'benzo': _BENZO_DRUGS,
+    'antidepressant': _ANTIDEPRESSANT_DRUGS,
+    'antipsychotic': _ANTIPSYCHOTIC_DRUGS,
+    'blood_thinner': _BLOOD_THINNER_DRUGS,
+    'gabapentin': _GABAPENTIN_DRUGS,
+    'suboxone': _SUBOXONE_DRUGS,
+})
+
+
+def _extract_mib_elements(xml_str: str) -> tuple:
+    """
+    Pull MIB elements in a single iterparse pass.
+
+    Returns (code_count, codes, bmi_stats) with codes as a set and
+    bmi_stats = (count, total, min, max). Code counting and BMI
+    aggregates run inside the loop so no intermediate list is
+    materialized - memory stays O(unique codes) even for large payloads.
+    Raises etree.XMLSyntaxError on malformed XML.
+    """
+    code_count = 0
+    codes = set()
+    bmi_count = 0
+    bmi_total = 0.0
+    bmi_min = float('inf')
+    bmi_max = float('-inf')
+
+    parser = etree.iterparse(
+        io.BytesIO(xml_str.encode()), events=('end',), tag=('ResponseData', 'BMI'))
+    for _event, elem in parser:
+        if elem.tag == 'ResponseData':
+            if elem.text:
+                code_count += 1
+                codes.add(elem.text)
+        else:
+            try:
+                value = float(elem.text)
+            except (TypeError, ValueError):
+                pass
+            else:
+                bmi_count += 1
+                bmi_total += value
+                bmi_min = value if value < bmi_min else bmi_min
+                bmi_max = value if value > bmi_max else bmi_max
+        elem.clear()
+
+    return code_count, codes, (bmi_count, bmi_total, bmi_min, bmi_max)
+
+
+def _extract_mib_elements_regex(xml_str: str) -> tuple:
+    """Regex fallback for _extract_mib_elements (same return shape)."""
+    code_count = 0
+    codes = set()
+    for match in _MIB_RESPONSE_RE.finditer(xml_str):
+        code_count += 1
+        codes.add(match.group(1))
+    # Walk the match iterator with running aggregates: one pass, no
+    # value list, same bmi_stats shape as the iterparse path
+    bmi_count = 0
+    bmi_total = 0.0
+    bmi_min = float('inf')
+    bmi_max = float('-inf')
+    for match in _MIB_BMI_RE.finditer(xml_str):
+        value = float(match.group(1))
+        bmi_count += 1
+        bmi_total += value
+        bmi_min = value if value < bmi_min else bmi_min
+        bmi_max = value if value > bmi_max else bmi_max
+    return code_count, codes, (bmi_count, bmi_total, bmi_min, bmi_max)
+
+
+def _extract_rx_elements(xml_str: str) -> tuple:
+    """
+    Pull RX elements in a single iterparse pass.
+
+    Returns (fill_count, drugs, specialties) with drugs/specialties as
+    sets. Raises etree.XMLSyntaxError on malformed XML.
+    """
+    fill_count = 0
+    drugs = set()
+    specialties = set()
+
+    parser = etree.iterparse(
+        io.BytesIO(xml_str.encode()), events=('end',),
+        tag=('DrugFill', 'DrugGenericName', 'PhysicianSpecialty'))
+    for _event, elem in parser:
+        if elem.tag == 'DrugFill':
+            fill_count += 1
+        elif elem.tag == 'DrugGenericName':
+            if elem.text:
+                drugs.add(elem.text)
+        else:
+            if elem.text:
+                specialties.add(elem.text)
+        elem.clear()
+
+    return fill_count, drugs, specialties
+
+
+def _extract_rx_elements_regex(xml_str: str) -> tuple:
+    """Regex fallback for _extract_rx_elements (same return shape)."""
+    fill_count = xml_str.count('<DrugFill>')
+    drugs = {m.group(1) for m in _RX_GENERIC_RE.finditer(xml_str)}
+    specialties = {m.group(1) for m in _RX_SPECIALTY_RE.finditer(xml_str)}
+    return fill_count, drugs, specialties
+
+
 # ============================================================================
-# PYDANTIC MODELS
+# MESSAGE SCHEMAS (msgspec - C-speed decode/validate, no per-field
+# descriptor overhead on the hot path)
 # ============================================================================
 
-class PredictRequest(BaseModel):
+class PredictRequest(msgspec.Struct):
     policy_number: str
     mib_xml: Optional[str] = None
     rx_xml: Optional[str] = None
 
-class PredictResponse(BaseModel):
+class SnowflakeBatch(msgspec.Struct):
+    """
+    Snowflake service-function payload: {"data": [[row_num, ...], ...]}.
+
+    include_features opts in to echoing the full per-row feature map.
+    Snowflake service functions cannot add payload keys, so their
+    default comes from the service-wide ECHO_FEATURES env var; direct
+    HTTP callers can still override it per request.
+    """
+    data: list = []
+    include_features: bool = ECHO_FEATURES
+
+class PredictResponse(msgspec.Struct):
     policy_number: str
     risk_score: float
     risk_level: str
     inference_ms: float
     feature_count: int = 105
 
+# Reusable decoder: parses the raw /predict body straight into
+# SnowflakeBatch without going through pydantic
+_BATCH_DECODER = msgspec.json.Decoder(SnowflakeBatch)
+
 # ============================================================================
 # XML PARSING - CUSTOMIZE FOR YOUR SCHEMA
 # ============================================================================
 
-def parse_mib_xml(xml_str: str) -> dict:
+# Feature schemas: (name, default) pairs in response order. Parsers fill
+# a list copied from the defaults tuple and write by slot, so no
+# per-request dict literal with ~40/~54 hashed inserts is built; the
+# dict only materializes at the response boundary.
+_MIB_SCHEMA = (
+    # Core MIB metrics
+    ('mib_hit_count', 0),
+    ('mib_try_count', 0),
+    ('mib_code_count', 0),
+    ('mib_total_records', 0),
+    ('mib_has_hit', False),
+
+    # BMI features
+    ('mib_avg_bmi', 0.0),
+    ('mib_max_bmi', 0.0),
+    ('mib_min_bmi', 0.0),
+    ('mib_bmi_over_30', False),
+    ('mib_bmi_over_35', False),
+
+    # Build data
+    ('mib_avg_height', 0.0),
+    ('mib_avg_weight', 0.0),
+    ('mib_max_weight', 0.0),
+    ('mib_weight_over_200', False),
+
+    # Condition codes
+    ('mib_has_cardiac_code', False),
+    ('mib_has_diabetes_code', False),
+    ('mib_has_cancer_code', False),
+    ('mib_has_respiratory_code', False),
+    ('mib_has_mental_health_code', False),
+    ('mib_has_substance_abuse_code', False),
+    ('mib_has_liver_code', False),
+    ('mib_has_kidney_code', False),
+    ('mib_has_neurological_code', False),
+    ('mib_has_autoimmune_code', False),
+    ('mib_has_blood_disorder_code', False),
+    ('mib_has_gastrointestinal_code', False),
+    ('mib_has_musculoskeletal_code', False),
+    ('mib_has_endocrine_code', False),
+    ('mib_has_infectious_code', False),
+
+    # Risk indicators
+    ('mib_high_risk_code_count', 0),
+    ('mib_medium_risk_code_count', 0),
+    ('mib_low_risk_code_count', 0),
+    ('mib_hit_ratio', 0.0),
+    ('mib_multiple_hits', False),
+
+    # Derived scores
+    ('mib_risk_score', 0.0),
+    ('mib_severity_score', 0.0),
+    ('mib_complexity_score', 0.0),
+    ('mib_overall_score', 0.0),
+)
+
+_RX_SCHEMA = (
+    # Core RX metrics
+    ('rx_total_fills', 0),
+    ('rx_unique_drugs', 0),
+    ('rx_unique_ndcs', 0),
+    ('rx_unique_specialties', 0),
+    ('rx_unique_prescribers', 0),
+
+    # Drug category flags
+    ('rx_drug_statin', False),
+    ('rx_drug_metformin', False),
+    ('rx_drug_insulin', False),
+    ('rx_drug_opioid', False),
+    ('rx_drug_benzo', False),
+    ('rx_drug_antidepressant', False),
+    ('rx_drug_antipsychotic', False),
+    ('rx_drug_blood_thinner', False),
+    ('rx_drug_ace_inhibitor', False),
+    ('rx_drug_beta_blocker', False),
+    ('rx_drug_calcium_blocker', False),
+    ('rx_drug_diuretic', False),
+    ('rx_drug_ppi', False),
+    ('rx_drug_thyroid', False),
+    ('rx_drug_antibiotic', False),
+    ('rx_drug_steroid', False),
+    ('rx_drug_immunosuppressant', False),
+    ('rx_drug_chemo', False),
+    ('rx_drug_biologic', False),
+    ('rx_drug_adhd', False),
+    ('rx_drug_sleep', False),
+    ('rx_drug_muscle_relaxant', False),
+    ('rx_drug_gabapentin', False),
+    ('rx_drug_suboxone', False),
+
+    # Specialty flags
+    ('rx_specialty_cardiology', False),
+    ('rx_specialty_endocrinology', False),
+    ('rx_specialty_oncology', False),
+    ('rx_specialty_psychiatry', False),
+    ('rx_specialty_neurology', False),
+    ('rx_specialty_pain_management', False),
+    ('rx_specialty_rheumatology', False),
+    ('rx_specialty_pulmonology', False),
+    ('rx_specialty_gastroenterology', False),
+    ('rx_specialty_nephrology', False),
+    ('rx_specialty_primary_care', False),
+    ('rx_specialty_emergency', False),
+
+    # Risk flags
+    ('flag_opioid_and_benzo', False),
+    ('flag_polypharmacy_5', False),
+    ('flag_polypharmacy_10', False),
+    ('flag_high_risk_combo', False),
+    ('flag_multiple_controlled', False),
+    ('flag_multiple_prescribers', False),
+
+    # Derived scores
+    ('rx_risk_score', 0.0),
+    ('rx_complexity_score', 0.0),
+    ('rx_cardiac_risk_score', 0.0),
+    ('rx_metabolic_risk_score', 0.0),
+    ('rx_mental_health_risk_score', 0.0),
+    ('rx_pain_risk_score', 0.0),
+    ('rx_overall_score', 0.0),
+)
+
+_MIB_KEYS = tuple(k for k, _ in _MIB_SCHEMA)
+_MIB_DEFAULTS = tuple(v for _, v in _MIB_SCHEMA)
+_MIB_INDEX = {k: i for i, k in enumerate(_MIB_KEYS)}
+
+_RX_KEYS = tuple(k for k, _ in _RX_SCHEMA)
+_RX_DEFAULTS = tuple(v for _, v in _RX_SCHEMA)
+_RX_INDEX = {k: i for i, k in enumerate(_RX_KEYS)}
+
+# Category flags are accumulated in a single machine word while parsing:
+# combination flags and risk counts become bitwise ops on the mask, and
+# the named booleans are expanded into the feature vector in one loop at
+# the end. Layout maps scanner category -> (bit, vector slot).
+_MIB_FLAG_LAYOUT = {
+    'cardiac': (1 << 0, _MIB_INDEX['mib_has_cardiac_code']),
+    'diabetes': (1 << 1, _MIB_INDEX['mib_has_diabetes_code']),
+    'cancer': (1 << 2, _MIB_INDEX['mib_has_cancer_code']),
+    'respiratory': (1 << 3, _MIB_INDEX['mib_has_respiratory_code']),
+    'mental_health': (1 << 4, _MIB_INDEX['mib_has_mental_health_code']),
+    'substance_abuse': (1 << 5, _MIB_INDEX['mib_has_substance_abuse_code']),
+}
+
+_RX_FLAG_LAYOUT = {
+    'statin': (1 << 0, _RX_INDEX['rx_drug_statin']),
+    'metformin': (1 << 1, _RX_INDEX['rx_drug_metformin']),
+    'insulin': (1 << 2, _RX_INDEX['rx_drug_insulin']),
+    'opioid': (1 << 3, _RX_INDEX['rx_drug_opioid']),
+    'benzo': (1 << 4, _RX_INDEX['rx_drug_benzo']),
+    'antidepressant': (1 << 5, _RX_INDEX['rx_drug_antidepressant']),
+    'antipsychotic': (1 << 6, _RX_INDEX['rx_drug_antipsychotic']),
+    'blood_thinner': (1 << 7, _RX_INDEX['rx_drug_blood_thinner']),
+    'gabapentin': (1 << 8, _RX_INDEX['rx_drug_gabapentin']),
+    'suboxone': (1 << 9, _RX_INDEX['rx_drug_suboxone']),
+}
+
+# Precombined masks for risk derivations
+_MIB_HIGH_RISK_MASK = (_MIB_FLAG_LAYOUT['cardiac'][0]
+                       | _MIB_FLAG_LAYOUT['cancer'][0]
+                       | _MIB_FLAG_LAYOUT['substance_abuse'][0])
+_RX_OPIOID_BIT = _RX_FLAG_LAYOUT['opioid'][0]
+_RX_BENZO_BIT = _RX_FLAG_LAYOUT['benzo'][0]
+_RX_GABAPENTIN_BIT = _RX_FLAG_LAYOUT['gabapentin'][0]
+_RX_OPIOID_BENZO_MASK = _RX_OPIOID_BIT | _RX_BENZO_BIT
+_RX_OPIOID_GABA_MASK = _RX_OPIOID_BIT | _RX_GABAPENTIN_BIT
+
+
+def parse_mib_xml(xml_str: str) -> list:
     """
     Parse MIB XML and extract features.
-    
-    CUSTOMIZE THIS FUNCTION for your XML schema.
-    Returns dict with 40 MIB features.
+
+    CUSTOMIZE THIS FUNCTION (and _MIB_SCHEMA) for your XML schema.
+    Returns a list of 38 MIB feature values aligned with _MIB_SCHEMA.
     """
-    features = {
-        # Core MIB metrics
-        'mib_hit_count': 0,
-        'mib_try_count': 0,
-        'mib_code_count': 0,
-        'mib_total_records': 0,
-        'mib_has_hit': False,
-        
-        # BMI features
-        'mib_avg_bmi': 0.0,
-        'mib_max_bmi': 0.0,
-        'mib_min_bmi': 0.0,
-        'mib_bmi_over_30': False,
-        'mib_bmi_over_35': False,
-        
-        # Build data
-        'mib_avg_height': 0.0,
-        'mib_avg_weight': 0.0,
-        'mib_max_weight': 0.0,
-        'mib_weight_over_200': False,
-        
-        # Condition codes
-        'mib_has_cardiac_code': False,
-        'mib_has_diabetes_code': False,
-        'mib_has_cancer_code': False,
-        'mib_has_respiratory_code': False,
-        'mib_has_mental_health_code': False,
-        'mib_has_substance_abuse_code': False,
-        'mib_has_liver_code': False,
-        'mib_has_kidney_code': False,
-        'mib_has_neurological_code': False,
-        'mib_has_autoimmune_code': False,
-        'mib_has_blood_disorder_code': False,
-        'mib_has_gastrointestinal_code': False,
-        'mib_has_musculoskeletal_code': False,
-        'mib_has_endocrine_code': False,
-        'mib_has_infectious_code': False,
-        
-        # Risk indicators
-        'mib_high_risk_code_count': 0,
-        'mib_medium_risk_code_count': 0,
-        'mib_low_risk_code_count': 0,
-        'mib_hit_ratio': 0.0,
-        'mib_multiple_hits': False,
-        
-        # Derived scores
-        'mib_risk_score': 0.0,
-        'mib_severity_score': 0.0,
-        'mib_complexity_score': 0.0,
-        'mib_overall_score': 0.0,
-    }
-    
+    vec = list(_MIB_DEFAULTS)
+
     if not xml_str:
-        return features
-    
-    # Parse response codes
-    codes = re.findall(r'<ResponseData>([^<]+)</ResponseData>', xml_str)
-    features['mib_code_count'] = len(codes)
-    features['mib_total_records'] = len(codes)
-    
-    # Check for HIT
-    if 'HIT' in xml_str or 'RelationRoleCode>HIT<' in xml_str:
-        features['mib_hit_count'] = 1
-        features['mib_has_hit'] = True
-    
-    # Parse BMI
-    bmi_values = re.findall(r'<BMI>(\d+\.?\d*)</BMI>', xml_str)
-    if bmi_values:
-        bmi_floats = [float(b) for b in bmi_values]
-        features['mib_avg_bmi'] = sum(bmi_floats) / len(bmi_floats)
-        features['mib_max_bmi'] = max(bmi_floats)
-        features['mib_min_bmi'] = min(bmi_floats)
-        features['mib_bmi_over_30'] = features['mib_max_bmi'] > 30
-        features['mib_bmi_over_35'] = features['mib_max_bmi'] > 35
-    
-    # Check condition codes (customize patterns for your schema)
-    code_str = ' '.join(codes).upper()
-    features['mib_has_cardiac_code'] = any(c in code_str for c in ['CARDIAC', 'HEART', 'CVD'])
-    features['mib_has_diabetes_code'] = any(c in code_str for c in ['DIABETES', 'DM', 'INSULIN'])
-    features['mib_has_cancer_code'] = any(c in code_str for c in ['CANCER', 'TUMOR', 'MALIG'])
-    features['mib_has_respiratory_code'] = any(c in code_str for c in ['COPD', 'ASTHMA', 'PULM'])
-    features['mib_has_mental_health_code'] = any(c in code_str for c in ['MENTAL', 'PSYCH', 'DEPRESS'])
-    features['mib_has_substance_abuse_code'] = any(c in code_str for c in ['SUBSTANCE', 'ALCOHOL', 'DRUG'])
-    
-    # Calculate risk scores
-    high_risk = sum([features['mib_has_cancer_code'], features['mib_has_cardiac_code'], 
-                     features['mib_has_substance_abuse_code']])
-    features['mib_high_risk_code_count'] = high_risk
-    features['mib_risk_score'] = min(1.0, high_risk * 0.3 + features['mib_hit_count'] * 0.2)
-    
-    return features
+        return vec
+
+    # Extract codes and BMI stats in one pass (regex fallback if lxml is
+    # unavailable or the payload is not well-formed XML)
+    if etree is not None:
+        try:
+            code_count, codes, bmi_stats = _extract_mib_elements(xml_str)
+        except etree.XMLSyntaxError:
+            code_count, codes, bmi_stats = _extract_mib_elements_regex(xml_str)
+    else:
+        code_count, codes, bmi_stats = _extract_mib_elements_regex(xml_str)
+
+    vec[_MIB_INDEX['mib_code_count']] = code_count
+    vec[_MIB_INDEX['mib_total_records']] = code_count
+
+    # Check for HIT (plain substring test - no regex needed for a literal)
+    has_hit = 'HIT' in xml_str
+    vec[_MIB_INDEX['mib_has_hit']] = has_hit
+    vec[_MIB_INDEX['mib_hit_count']] = int(has_hit)
+
+    bmi_count, bmi_total, bmi_min, bmi_max = bmi_stats
+    if bmi_count:
+        vec[_MIB_INDEX['mib_avg_bmi']] = bmi_total / bmi_count
+        vec[_MIB_INDEX['mib_max_bmi']] = bmi_max
+        vec[_MIB_INDEX['mib_min_bmi']] = bmi_min
+        vec[_MIB_INDEX['mib_bmi_over_30']] = bmi_max > 30
+        vec[_MIB_INDEX['mib_bmi_over_35']] = bmi_max > 35
+
+    # Check condition codes in one multi-needle pass over the tokens,
+    # packing the hits into a bitmask (customize keyword sets for your
+    # schema)
+    mask = 0
+    for hit in _scan_categories(codes, _MIB_CODE_SCANNER):
+        mask |= _MIB_FLAG_LAYOUT[hit][0]
+    for bit, slot in _MIB_FLAG_LAYOUT.values():
+        vec[slot] = bool(mask & bit)
+
+    # Calculate risk scores: the high-risk count is one AND + popcount
+    high_risk = (mask & _MIB_HIGH_RISK_MASK).bit_count()
+    vec[_MIB_INDEX['mib_high_risk_code_count']] = high_risk
+    vec[_MIB_INDEX['mib_risk_score']] = min(1.0, high_risk * 0.3 + int(has_hit) * 0.2)
+
+    return vec
 
 
-def parse_rx_xml(xml_str: str) -> dict:
+def parse_rx_xml(xml_str: str) -> list:
     """
     Parse RX XML and extract features.
-    
-    CUSTOMIZE THIS FUNCTION for your XML schema.
-    Returns dict with 65 RX features.
+
+    CUSTOMIZE THIS FUNCTION (and _RX_SCHEMA) for your XML schema.
+    Returns a list of 54 RX feature values aligned with _RX_SCHEMA.
     """
-    features = {
-        # Core RX metrics
-        'rx_total_fills': 0,
-        'rx_unique_drugs': 0,
-        'rx_unique_ndcs': 0,
-        'rx_unique_specialties': 0,
-        'rx_unique_prescribers': 0,
-        
-        # Drug category flags
-        'rx_drug_statin': False,
-        'rx_drug_metformin': False,
-        'rx_drug_insulin': False,
-        'rx_drug_opioid': False,
-        'rx_drug_benzo': False,
-        'rx_drug_antidepressant': False,
-        'rx_drug_antipsychotic': False,
-        'rx_drug_blood_thinner': False,
-        'rx_drug_ace_inhibitor': False,
-        'rx_drug_beta_blocker': False,
-        'rx_drug_calcium_blocker': False,
-        'rx_drug_diuretic': False,
-        'rx_drug_ppi': False,
-        'rx_drug_thyroid': False,
-        'rx_drug_antibiotic': False,
-        'rx_drug_steroid': False,
-        'rx_drug_immunosuppressant': False,
-        'rx_drug_chemo': False,
-        'rx_drug_biologic': False,
-        'rx_drug_adhd': False,
-        'rx_drug_sleep': False,
-        'rx_drug_muscle_relaxant': False,
-        'rx_drug_gabapentin': False,
-        'rx_drug_suboxone': False,
-        
-        # Specialty flags
-        'rx_specialty_cardiology': False,
-        'rx_specialty_endocrinology': False,
-        'rx_specialty_oncology': False,
-        'rx_specialty_psychiatry': False,
-        'rx_specialty_neurology': False,
-        'rx_specialty_pain_management': False,
-        'rx_specialty_rheumatology': False,
-        'rx_specialty_pulmonology': False,
-        'rx_specialty_gastroenterology': False,
-        'rx_specialty_nephrology': False,
-        'rx_specialty_primary_care': False,
-        'rx_specialty_emergency': False,
-        
-        # Risk flags
-        'flag_opioid_and_benzo': False,
-        'flag_polypharmacy_5': False,
-        'flag_polypharmacy_10': False,
-        'flag_high_risk_combo': False,
-        'flag_multiple_controlled': False,
-        'flag_multiple_prescribers': False,
-        
-        # Derived scores
-        'rx_risk_score': 0.0,
-        'rx_complexity_score': 0.0,
-        'rx_cardiac_risk_score': 0.0,
-        'rx_metabolic_risk_score': 0.0,
-        'rx_mental_health_risk_score': 0.0,
-        'rx_pain_risk_score': 0.0,
-        'rx_overall_score': 0.0,
-    }
-    
+    vec = list(_RX_DEFAULTS)
+
     if not xml_str:
-        return features
-    
-    # Parse fills
-    fills = re.findall(r'<DrugFill>', xml_str)
-    features['rx_total_fills'] = len(fills)
-    
-    # Parse drugs
-    drugs = set(re.findall(r'<DrugGenericName>([^<]+)</DrugGenericName>', xml_str))
-    features['rx_unique_drugs'] = len(drugs)
-    
-    # Parse specialties
-    specialties = set(re.findall(r'<PhysicianSpecialty>([^<]+)</PhysicianSpecialty>', xml_str))
-    features['rx_unique_specialties'] = len(specialties)
-    
-    drug_str = ' '.join(drugs).upper()
-    spec_str = ' '.join(specialties).upper()
-    
-    # Drug detection (customize patterns for your formulary)
-    features['rx_drug_statin'] = any(d in drug_str for d in ['STATIN', 'ATORVASTATIN', 'SIMVASTATIN'])
-    features['rx_drug_metformin'] = 'METFORMIN' in drug_str
-    features['rx_drug_insulin'] = 'INSULIN' in drug_str
-    features['rx_drug_opioid'] = any(d in drug_str for d in ['OXYCODONE', 'HYDROCODONE', 'MORPHINE', 'FENTANYL'])
-    features['rx_drug_benzo'] = any(d in drug_str for d in ['ALPRAZOLAM', 'DIAZEPAM', 'LORAZEPAM', 'CLONAZEPAM'])
-    features['rx_drug_antidepressant'] = any(d in drug_str for d in ['SERTRALINE', 'FLUOXETINE', 'ESCITALOPRAM'])
-    features['rx_drug_antipsychotic'] = any(d in drug_str for d in ['QUETIAPINE', 'RISPERIDONE', 'ARIPIPRAZOLE'])
-    features['rx_drug_blood_thinner'] = any(d in drug_str for d in ['WARFARIN', 'ELIQUIS', 'XARELTO'])
-    features['rx_drug_gabapentin'] = 'GABAPENTIN' in drug_str or 'PREGABALIN' in drug_str
-    features['rx_drug_suboxone'] = any(d in drug_str for d in ['SUBOXONE', 'BUPRENORPHINE'])
-    
-    # Risk flags
-    features['flag_opioid_and_benzo'] = features['rx_drug_opioid'] and features['rx_drug_benzo']
-    features['flag_polypharmacy_5'] = features['rx_unique_drugs'] >= 5
-    features['flag_polypharmacy_10'] = features['rx_unique_drugs'] >= 10
-    features['flag_high_risk_combo'] = features['flag_opioid_and_benzo'] or (features['rx_drug_opioid'] and features['rx_drug_gabapentin'])
-    
+        return vec
+
+    # Extract fills, drugs and specialties in one pass (regex fallback if
+    # lxml is unavailable or the payload is not well-formed XML)
+    if etree is not None:
+        try:
+            fill_count, drugs, specialties = _extract_rx_elements(xml_str)
+        except etree.XMLSyntaxError:
+            fill_count, drugs, specialties = _extract_rx_elements_regex(xml_str)
+    else:
+        fill_count, drugs, specialties = _extract_rx_elements_regex(xml_str)
+
+    unique_drugs = len(drugs)
+    vec[_RX_INDEX['rx_total_fills']] = fill_count
+    vec[_RX_INDEX['rx_unique_drugs']] = unique_drugs
+    vec[_RX_INDEX['rx_unique_specialties']] = len(specialties)
+
+    # Drug detection in one multi-needle pass over the tokens, packing
+    # the hits into a bitmask (customize keyword sets for your formulary)
+    mask = 0
+    for hit in _scan_categories(drugs, _RX_DRUG_SCANNER):
+        mask |= _RX_FLAG_LAYOUT[hit][0]
+    for bit, slot in _RX_FLAG_LAYOUT.values():
+        vec[slot] = bool(mask & bit)
+
+    # Risk flags: combinations are single mask comparisons
+    has_opioid = bool(mask & _RX_OPIOID_BIT)
+    has_benzo = bool(mask & _RX_BENZO_BIT)
+    opioid_and_benzo = (mask & _RX_OPIOID_BENZO_MASK) == _RX_OPIOID_BENZO_MASK
+    vec[_RX_INDEX['flag_opioid_and_benzo']] = opioid_and_benzo
+    vec[_RX_INDEX['flag_polypharmacy_5']] = unique_drugs >= 5
+    vec[_RX_INDEX['flag_polypharmacy_10']] = unique_drugs >= 10
+    vec[_RX_INDEX['flag_high_risk_combo']] = (
+        opioid_and_benzo or (mask & _RX_OPIOID_GABA_MASK) == _RX_OPIOID_GABA_MASK)
+
     # Calculate risk scores
-    features['rx_pain_risk_score'] = min(1.0, (0.15 if features['rx_drug_opioid'] else 0) + 
-                                         (0.10 if features['rx_drug_benzo'] else 0) +
-                                         (0.25 if features['flag_opioid_and_benzo'] else 0))
-    features['rx_complexity_score'] = min(1.0, features['rx_unique_drugs'] * 0.08)
-    features['rx_risk_score'] = (features['rx_pain_risk_score'] * 0.5 + features['rx_complexity_score'] * 0.5)
-    
-    return features
+    pain_risk = min(1.0, (0.15 if has_opioid else 0) +
+                    (0.10 if has_benzo else 0) +
+                    (0.25 if opioid_and_benzo else 0))
+    complexity = min(1.0, unique_drugs * 0.08)
+    vec[_RX_INDEX['rx_pain_risk_score']] = pain_risk
+    vec[_RX_INDEX['rx_complexity_score']] = complexity
+    vec[_RX_INDEX['rx_risk_score']] = pain_risk * 0.5 + complexity * 0.5
 
+    return vec
+
+
+# Parse-result cache: batch re-runs, retries and dashboard demos post
+# the same XML blobs repeatedly, so repeated payloads skip parsing
+# entirely. Keys are 16-byte content digests (not the XML itself, which
+# would pin large strings in memory); values are fixed-order tuples.
+_PARSE_CACHE_SIZE = 4096
+_MIB_CACHE = OrderedDict()
+_RX_CACHE = OrderedDict()
+# Parses run on asyncio.to_thread workers, so cache mutations (recency
+# bump, insert, eviction) must be serialized or a lookup can race an
+# eviction and KeyError. One lock covers both caches; the parse itself
+# runs outside it.
+_PARSE_CACHE_LOCK = threading.Lock()
+
+
+def _cached_values(cache: OrderedDict, parse_fn, xml_str: str) -> tuple:
+    """Look up (or compute and store) the feature tuple for one payload."""
+    key = blake2b(xml_str.encode(), digest_size=16).digest()
+    with _PARSE_CACHE_LOCK:
+        values = cache.get(key)
+        if values is not None:
+            cache.move_to_end(key)
+            return values
+    values = tuple(parse_fn(xml_str))
+    with _PARSE_CACHE_LOCK:
+        cache[key] = values
+        if len(cache) > _PARSE_CACHE_SIZE:
+            cache.popitem(last=False)
+    return values
+
+
+def parse_mib_features(xml_str: str) -> dict:
+    """Cached front-end for parse_mib_xml (returns a fresh dict)."""
+    return dict(zip(_MIB_KEYS, _cached_values(_MIB_CACHE, parse_mib_xml, xml_str)))
+
+
+def parse_rx_features(xml_str: str) -> dict:
+    """Cached front-end for parse_rx_xml (returns a fresh dict)."""
+    return dict(zip(_RX_KEYS, _cached_values(_RX_CACHE, parse_rx_xml, xml_str)))
+
+
+# Fixed slot order for the scoring vector. _score_vec reads by position
+# so the arithmetic runs without any dict hashing (and compiles cleanly
+# under Numba where available).
+_SCORE_FEATURE_ORDER = (
+    'mib_hit_count',                # 0
+    'mib_code_count',               # 1
+    'mib_bmi_over_35',              # 2
+    'mib_has_cardiac_code',         # 3
+    'mib_has_cancer_code',          # 4
+    'mib_has_substance_abuse_code', # 5
+    'rx_total_fills',               # 6
+    'rx_unique_drugs',              # 7
+    'rx_drug_opioid',               # 8
+    'rx_drug_benzo',                # 9
+    'rx_drug_insulin',              # 10
+    'flag_opioid_and_benzo',        # 11
+    'flag_high_risk_combo',         # 12
+    'flag_polypharmacy_10',         # 13
+)
+
+
+def _score_vec(v) -> float:
+    """Rule-based score over a _SCORE_FEATURE_ORDER vector."""
+    score = 0.15 * v[0]
 
-def calculate_risk_score(features: dict) -> float:
-    """
-    Calculate overall risk score from extracted features.
-    
-    CUSTOMIZE THIS FUNCTION with your scoring logic.
-    Can integrate with ML model or use rule-based scoring.
-    """
-    score = 0.0
-    
     # MIB factors
-    score += features.get('mib_hit_count', 0) * 0.15
-    score += min(0.15, features.get('mib_code_count', 0) * 0.025)
-    score += 0.1 if features.get('mib_bmi_over_35', False) else 0
-    score += 0.1 if features.get('mib_has_cardiac_code', False) else 0
-    score += 0.15 if features.get('mib_has_cancer_code', False) else 0
-    score += 0.12 if features.get('mib_has_substance_abuse_code', False) else 0
-    
+    score += min(0.15, v[1] * 0.025)
+    if v[2] > 0:
+        score += 0.1   # BMI over 35
+    if v[3] > 0:
+        score += 0.1   # cardiac code
+    if v[4] > 0:
+        score += 0.15  # cancer code
+    if v[5] > 0:
+        score += 0.12  # substance abuse code
+
     # RX factors
-    score += min(0.15, features.get('rx_total_fills', 0) * 0.02)
-    score += min(0.12, features.get('rx_unique_drugs', 0) * 0.02)
-    score += 0.15 if features.get('rx_drug_opioid', False) else 0
-    score += 0.10 if features.get('rx_drug_benzo', False) else 0
-    score += 0.12 if features.get('rx_drug_insulin', False) else 0
-    
+    score += min(0.15, v[6] * 0.02)
+    score += min(0.12, v[7] * 0.02)
+    if v[8] > 0:
+        score += 0.15  # opioid
+    if v[9] > 0:
+        score += 0.10  # benzo
+    if v[10] > 0:
+        score += 0.12  # insulin
+
     # High-risk combinations
-    score += 0.25 if features.get('flag_opioid_and_benzo', False) else 0
-    score += 0.15 if features.get('flag_high_risk_combo', False) else 0
-    score += 0.10 if features.get('flag_polypharmacy_10', False) else 0
-    
+    if v[11] > 0:
+        score += 0.25  # opioid + benzo
+    if v[12] > 0:
+        score += 0.15  # high-risk combo
+    if v[13] > 0:
+        score += 0.10  # polypharmacy >= 10
+
     return min(1.0, score)
 
 
-def call_model_registry(features: dict) -> tuple:
+try:
+    import numpy as np
+    from numba import njit
+except ImportError:
+    np = None
+else:
+    # Compile the scoring kernel to native code and absorb the one-time
+    # JIT cost at import, off the request path
+    _score_vec = njit(cache=True, fastmath=True)(_score_vec)
+    _score_vec(np.zeros(len(_SCORE_FEATURE_ORDER)))
+
+
+def _features_to_vec(features: dict):
+    """Project a feature dict onto the fixed scoring slot order."""
+    vec = [float(features.get(name, 0)) for name in _SCORE_FEATURE_ORDER]
+    return np.asarray(vec) if np is not None else vec
+
+
+def calculate_risk_score(features: dict) -> float:
     """
-    Call Model Registry inference service via internal DNS.
-    
+    Calculate overall risk score from extracted features.
+
+    CUSTOMIZE _SCORE_FEATURE_ORDER and _score_vec with your scoring
+    logic. Can integrate with ML model or use rule-based scoring.
+    """
+    return float(_score_vec(_features_to_vec(features)))
+
+
+async def _no_features() -> dict:
+    return {}
+
+
+async def _extract_row_features(mib_xml: Optional[str], rx_xml: Optional[str]) -> tuple:
+    """
+    Extract MIB and RX features for one row off the event loop.
+
+    Both parsers are CPU-bound, so they run in worker threads: the
+    uvicorn loop stays free for other requests and the two documents
+    parse concurrently. Returns (mib_features, rx_features, parse_ms).
+    """
+    start_time = time.time()
+    mib_features, rx_features = await asyncio.gather(
+        asyncio.to_thread(parse_mib_features, mib_xml) if mib_xml else _no_features(),
+        asyncio.to_thread(parse_rx_features, rx_xml) if rx_xml else _no_features(),
+    )
+    parse_ms = (time.time() - start_time) * 1000
+    return mib_features, rx_features, parse_ms
+
+
+# Static response body for rows that carry no XML evidence; matches what
+# the full pipeline would produce for an empty payload
+_EMPTY_ROW_RESULT = {
+    "risk_score": 0.0,
+    "risk_level": "LOW",
+    "model_version": "RULE_BASED",
+    "inference_ms": 0.0,
+    "feature_count": 105,
+}
+
+
+def _rounded(features: dict) -> dict:
+    """Trim float features to 4 decimals for the response echo."""
+    return {k: round(v, 4) if type(v) is float else v for k, v in features.items()}
+
+
+def _registry_features(features: dict) -> dict:
+    """Project extracted features onto the Model Registry input columns."""
+    return {
+        "MIB_TOTAL_RECORDS": features.get('mib_total_records', 0),
+        "MIB_HIT_COUNT": features.get('mib_hit_count', 0),
+        "MIB_HAS_HIT": 1 if features.get('mib_has_hit', False) else 0,
+        "MIB_AVG_BMI": features.get('mib_avg_bmi', 25.0),
+        "RX_TOTAL_FILLS": features.get('rx_total_fills', 0),
+        "RX_UNIQUE_DRUGS": features.get('rx_unique_drugs', 0),
+        "RX_DRUG_OPIOID": 1 if features.get('rx_drug_opioid', False) else 0,
+        "HAS_MIB_EVIDENCE": 1 if features.get('mib_total_records', 0) > 0 else 0,
+        "HAS_RX_EVIDENCE": 1 if features.get('rx_total_fills', 0) > 0 else 0,
+        "COMBINED_RISK_SCORE": 0
+    }
+
+
+# Memoized registry response shape. The registry returns the same row
+# shape for the life of the service, so the dict-vs-scalar output branch
+# is detected once on the first usable row and the specialized path is
+# taken afterwards. A mismatch (e.g. after a model redeploy) clears the
+# memo and falls back to full detection.
+_RESP_SHAPE = None  # None (undetected) | 'dict_out' | 'scalar_out'
+
+
+def _registry_score(pred) -> Optional[float]:
+    """Extract one prediction value; None if the row shape is unusable."""
+    global _RESP_SHAPE
+    try:
+        if _RESP_SHAPE == 'dict_out':
+            return float(pred[1]["output_feature_0"])
+        if _RESP_SHAPE == 'scalar_out':
+            return float(pred[1])
+    except (TypeError, ValueError, KeyError, IndexError):
+        _RESP_SHAPE = None  # Shape changed; re-detect below
+
+    if isinstance(pred, list) and len(pred) > 1:
+        pred_value = pred[1]
+        try:
+            if isinstance(pred_value, dict):
+                score = float(pred_value.get("output_feature_0", 0))
+                _RESP_SHAPE = 'dict_out'
+            else:
+                score = float(pred_value)
+                _RESP_SHAPE = 'scalar_out'
+            return score
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+async def call_model_registry(client: httpx.AsyncClient, feature_dicts: list) -> list:
+    """
+    Score a batch of feature dicts against the Model Registry service.
+
     Returns:
-        (risk_score, model_version) tuple
-    
+        List of risk scores aligned with feature_dicts. A None entry
+        means the registry result for that row was unusable and the
+        caller should fall back to rule-based scoring.
+
     This is the MLOps best practice per Caleb's recommendation:
     - Model deployed as service via mv.create_service()
     - Called via internal DNS (e.g., your-model-svc:5000/predict)
     - ~17ms latency vs 10+ seconds for SQL model calls
+
+    All rows ship in one request, so a multi-row Snowflake service
+    function call costs a single registry round-trip instead of N. The
+    client is the long-lived app.state.http instance so keep-alive
+    connections are reused instead of re-handshaking per prediction.
     """
+    scores = [None] * len(feature_dicts)
     try:
-        import httpx
-        
-        # Prepare features for Model Registry format
-        feature_dict = {
-            "MIB_TOTAL_RECORDS": features.get('mib_total_records', 0),
-            "MIB_HIT_COUNT": features.get('mib_hit_count', 0),
-            "MIB_HAS_HIT": 1 if features.get('mib_has_hit', False) else 0,
-            "MIB_AVG_BMI": features.get('mib_avg_bmi', 25.0),
-            "RX_TOTAL_FILLS": features.get('rx_total_fills', 0),
-            "RX_UNIQUE_DRUGS": features.get('rx_unique_drugs', 0),
-            "RX_DRUG_OPIOID": 1 if features.get('rx_drug_opioid', False) else 0,
-            "HAS_MIB_EVIDENCE": 1 if features.get('mib_total_records', 0) > 0 else 0,
-            "HAS_RX_EVIDENCE": 1 if features.get('rx_total_fills', 0) > 0 else 0,
-            "COMBINED_RISK_SCORE": 0
+        # Model Registry format: {"data": [[index, feature_dict], ...]}
+        inference_input = {
+            "data": [[i, _registry_features(f)] for i, f in enumerate(feature_dicts)]
         }
-        
-        # Model Registry format: {"data": [[index, feature_dict]]}
-        inference_input = {"data": [[0, feature_dict]]}
-        
-        # Call via internal DNS
-        with httpx.Client(timeout=5.0) as client:
-            response = client.post(
-                MODEL_SERVICE_URL,
-                json=inference_input,
-                headers={"Content-Type": "application/json"}
-            )
-            response.raise_for_status()
-            result = response.json()
-            
-            # Extract prediction: {"data": [[index, {"output_feature_0": value}]]}
-            if "data" in result and len(result["data"]) > 0:
-                pred = result["data"][0]
-                if isinstance(pred, list) and len(pred) > 1:
-                    pred_value = pred[1]
-                    if isinstance(pred_value, dict):
-                        risk_score = float(pred_value.get("output_feature_0", 0))
-                    else:
-                        risk_score = float(pred_value)
-                    return risk_score, "REGISTRY_V2"
-        
-        return calculate_risk_score(features), "RULE_BASED"
-        
+
+        # Call via internal DNS on the shared keep-alive client
+        response = await client.post(
+            MODEL_SERVICE_URL,
+            json=inference_input,
+            headers={"Content-Type": "application/json"}
+        )
+        response.raise_for_status()
+        result = response.json()
+
+        # Extract predictions: {"data": [[index, {"output_feature_0": value}], ...]}
+        for i, pred in enumerate(result.get("data", [])[:len(scores)]):
+            scores[i] = _registry_score(pred)
+        return scores
+
     except Exception as e:
         print(f"Model service error: {e}, using rule-based fallback")
-        return calculate_risk_score(features), "RULE_BASED"
+        return scores
 
 
 # ============================================================================
@@ -371,74 +818,129 @@ def call_model_registry(features: dict) -> tuple:
 async def lifespan(app: FastAPI):
     """Application lifespan handler."""
     print("Starting Real-Time ML Inference API...")
+    # Long-lived client for Model Registry calls: connections stay warm
+    # across requests instead of paying a TCP handshake per prediction
+    app.state.http = httpx.AsyncClient(
+        timeout=5.0,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+    )
+
+    # Coarse cached timestamp for /health: Snowflake polls the endpoint
+    # aggressively and sub-second precision is not needed there
+    async def _tick():
+        while True:
+            app.state.now_iso = datetime.utcnow().isoformat()
+            await asyncio.sleep(0.5)
+
+    app.state.now_iso = datetime.utcnow().isoformat()
+    clock_task = asyncio.create_task(_tick())
+
     yield
+
+    clock_task.cancel()
+    await app.state.http.aclose()
     print("Shutting down...")
 
 app = FastAPI(
     title="Real-Time ML Inference API",
     description="SPCS-hosted API for real-time risk scoring",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 
 @app.post("/health")
 async def health_check():
     """Health check endpoint for Snowflake service function."""
-    return {"data": [[0, {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}]]}
+    return {"data": [[0, {"status": "healthy", "timestamp": app.state.now_iso}]]}
 
 
 @app.post("/predict")
-async def predict(request: dict = None):
+async def predict(request: Request):
     """
     Main prediction endpoint.
-    
+
     Called via Snowflake service function:
     SELECT FN_PREDICT('policy_id', '<mib_xml>', '<rx_xml>');
     """
+    try:
+        batch = _BATCH_DECODER.decode(await request.body())
+    except msgspec.DecodeError:
+        batch = None
+
     # Handle Snowflake service function format
-    if request and "data" in request:
-        results = []
-        for row in request["data"]:
+    if batch and batch.data:
+        # Collect row metadata, then extract features for all rows
+        # concurrently in worker threads
+        meta = []
+        for row in batch.data:
             row_num = row[0]
-            policy_number = row[1] if len(row) > 1 else f"AUTO-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
+            policy_number = row[1] if len(row) > 1 else f"AUTO-{time.time_ns():x}"
             mib_xml = row[2] if len(row) > 2 else None
             rx_xml = row[3] if len(row) > 3 else None
-            
-            start_time = time.time()
-            
-            # Parse XML and extract features
-            mib_features = parse_mib_xml(mib_xml) if mib_xml else {}
-            rx_features = parse_rx_xml(rx_xml) if rx_xml else {}
-            
-            # Combine all features
-            all_features = {**mib_features, **rx_features}
-            
-            # Calculate risk score - use Model Registry if configured
-            if USE_MODEL_REGISTRY:
-                risk_score, model_version = call_model_registry(all_features)
+            meta.append((row_num, policy_number, mib_xml, rx_xml))
+
+        # Rows with no evidence at all (sentinel/keepalive probes) take a
+        # precomputed default response and never touch parse or registry
+        live_idx = [i for i, (_, _, mib_xml, rx_xml) in enumerate(meta)
+                    if mib_xml or rx_xml]
+        live_features = await asyncio.gather(
+            *(_extract_row_features(meta[i][2], meta[i][3]) for i in live_idx))
+        feature_by_row = dict(zip(live_idx, live_features))
+
+        # Score the live rows in one Model Registry round-trip
+        registry_by_row = {}
+        registry_ms = 0.0
+        if USE_MODEL_REGISTRY and live_idx:
+            registry_start = time.time()
+            registry_scores = await call_model_registry(
+                app.state.http,
+                [{**feature_by_row[i][0], **feature_by_row[i][1]} for i in live_idx])
+            registry_ms = (time.time() - registry_start) * 1000
+            registry_by_row = dict(zip(live_idx, registry_scores))
+
+        results = []
+        for i, (row_num, policy_number, _, _) in enumerate(meta):
+            entry = feature_by_row.get(i)
+            if entry is None:
+                row_result = {"policy_number": policy_number, **_EMPTY_ROW_RESULT}
+                if batch.include_features:
+                    row_result["features"] = {"mib": {}, "rx": {}}
+                results.append([row_num, row_result])
+                continue
+
+            mib_features, rx_features, parse_ms = entry
+
+            # Per-row fallback to rule-based scoring when the registry is
+            # disabled or returned nothing usable for this row
+            if registry_by_row.get(i) is not None:
+                risk_score = registry_by_row[i]
+                model_version = "REGISTRY_V2"
             else:
-                risk_score = calculate_risk_score(all_features)
+                risk_score = calculate_risk_score({**mib_features, **rx_features})
                 model_version = "RULE_BASED"
-            
+
             risk_level = 'HIGH' if risk_score >= 0.6 else ('MEDIUM' if risk_score >= 0.3 else 'LOW')
-            
-            elapsed_ms = round((time.time() - start_time) * 1000, 2)
-            
-            results.append([row_num, {
+
+            elapsed_ms = round(parse_ms + registry_ms, 2)
+
+            row_result = {
                 "policy_number": policy_number,
                 "risk_score": round(risk_score, 4),
                 "risk_level": risk_level,
                 "model_version": model_version,
                 "inference_ms": elapsed_ms,
                 "feature_count": 105,
-                "features": {
-                    "mib": mib_features,
-                    "rx": rx_features
+            }
+            if batch.include_features:
+                row_result["features"] = {
+                    "mib": _rounded(mib_features),
+                    "rx": _rounded(rx_features),
                 }
-            }])
-        
-        return {"data": results}
+            results.append([row_num, row_result])
+
+        return ORJSONResponse({"data": results})
     
     return {"data": [[0, {"status": "ok", "message": "Use via Snowflake service function"}]]}
 
@@ -456,5 +958,16 @@ async def root():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # uvloop + httptools give ~1.5-2x throughput over the default loop;
+    # one worker per core scales near-linearly on multi-core SPCS nodes
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=os.cpu_count(),
+        loop="uvloop",
+        http="httptools",
+        log_level="warning",
+        access_log=False,
+    )
 
@@ -38,6 +38,9 @@ spec:
         SNOWFLAKE_SCHEMA: ML_MODELS
         # Enable Model Registry integration (set to 'true' to use model service)
         USE_MODEL_REGISTRY: 'true'
+        # Echo the full per-row feature map in responses (debugging aid;
+        # inflates response size - keep 'false' in production)
+        ECHO_FEATURES: 'false'
         # ============================================================
         # ⚠️ UPDATE THIS URL WITH YOUR MODEL SERVICE NAME!
         # ============================================================
@@ -4,6 +4,7 @@
 # Streamlit dashboard for testing and monitoring SPCS inference pipeline
 
 import streamlit as st
+import pandas as pd
 from snowflake.snowpark.context import get_active_session
 from datetime import datetime
 import json
@@ -20,6 +21,52 @@ FULL_SERVICE_NAME = f"{SERVICE_SCHEMA}.{SERVICE_NAME}"
 FEATURE_TABLE = "FEATURE_STORE.ONLINE_FEATURES"
 PREDICTIONS_TABLE = "ML_MODELS.MODEL_PREDICTIONS"
 
+# SQL bound once at import: Snowflake's result cache requires
+# byte-identical query text, so building these per rerun (or letting a
+# table name drift into them dynamically) would forfeit cache hits.
+# {{limit}} stays a placeholder - each limit value yields one stable
+# query string.
+_EXPLORER_SQL = f"""
+    SELECT 'F' AS SRC, POLICY_NUMBER, COMBINED_RISK_SCORE AS SCORE,
+           HAS_MIB_DATA, HAS_RX_DATA,
+           NULL AS PREDICTION_CLASS, NULL AS MODEL_VERSION,
+           FEATURE_CREATED_AT AS CREATED_AT
+    FROM (SELECT * FROM {FEATURE_TABLE}
+          ORDER BY FEATURE_CREATED_AT DESC LIMIT {{limit}})
+    UNION ALL
+    SELECT 'P', POLICY_NUMBER, PREDICTION,
+           NULL, NULL,
+           COALESCE(PREDICTION_CLASS, 'N/A'), COALESCE(MODEL_VERSION, 'N/A'),
+           CREATED_AT
+    FROM (SELECT * FROM {PREDICTIONS_TABLE}
+          ORDER BY CREATED_AT DESC LIMIT {{limit}})
+"""
+
+_STATUS_SQL = f"SELECT SYSTEM$GET_SERVICE_STATUS('{FULL_SERVICE_NAME}')"
+_SUSPEND_SQL = f"ALTER SERVICE {FULL_SERVICE_NAME} SUSPEND"
+_RESUME_SQL = f"ALTER SERVICE {FULL_SERVICE_NAME} RESUME"
+
+# Static help text for the SPCS Controls view, built once at import so
+# reruns just hand Streamlit the same string object
+_SPCS_TIPS_MD = """
+### 💡 Tips
+- **Suspend** when not using to save costs
+- **Resume** takes 20-30 seconds to start
+- Service auto-scales between MIN and MAX instances
+
+### 📊 Monitoring Commands (run in Snowsight)
+```sql
+-- Check service status
+CALL SYSTEM$GET_SERVICE_STATUS('ML_MODELS.INFERENCE_SERVICE');
+
+-- View service logs
+CALL SYSTEM$GET_SERVICE_LOGS('ML_MODELS.INFERENCE_SERVICE', 0, 'api', 100);
+
+-- Check endpoints
+SHOW ENDPOINTS IN SERVICE ML_MODELS.INFERENCE_SERVICE;
+```
+"""
+
 # Page config
 st.set_page_config(
     page_title="Real-Time ML Pipeline",
@@ -98,17 +145,38 @@ def save_prediction(policy_number: str, risk_score: float, risk_level: str):
         st.error(f"Prediction Save Error: {str(e)}")
         return False
 
+@st.cache_data(ttl=30, show_spinner=False)
+def _load_explorer(limit: int = 10) -> "tuple[pd.DataFrame, pd.DataFrame]":
+    """Fetch both Explorer result sets in one round-trip.
+
+    The feature and prediction queries are fused with UNION ALL behind
+    a SRC discriminator column (unshared columns are NULL-padded), so a
+    rerun pays one network round-trip instead of two serialized ones.
+    Columns ship in their native types - 8-byte floats, booleans and
+    timestamps pack tighter in Arrow than display strings and keep the
+    frontend able to sort properly; rendering format is applied by
+    st.column_config at the display call. Fetches via to_pandas() so
+    the result arrives as one Arrow-backed DataFrame instead of per-row
+    Python objects from collect(), then splits by SRC locally. Returns
+    (features_df, predictions_df). Identical query text also keeps
+    Snowflake's own result cache warm.
+    """
+    both = session.sql(_EXPLORER_SQL.format(limit=limit)).to_pandas()
+    # UNION ALL does not preserve per-branch ordering, so re-sort each
+    # slice newest-first on the raw timestamp kept for that purpose
+    both = both.sort_values("CREATED_AT", ascending=False)
+    features = both[both["SRC"] == "F"]
+    predictions = both[both["SRC"] == "P"]
+    return features, predictions
+
 def get_spcs_status() -> str:
     """Get SPCS service status with robust error handling."""
     try:
-        result = session.sql(f"""
-            SELECT SYSTEM$GET_SERVICE_STATUS('{FULL_SERVICE_NAME}')
-        """).collect()
+        result = session.sql(_STATUS_SQL).collect()
         
         if result and result[0][0]:
             status_json = result[0][0]
             if isinstance(status_json, str):
-                import json
                 parsed = json.loads(status_json)
                 if isinstance(parsed, list) and len(parsed) > 0:
                     return parsed[0].get('status', 'UNKNOWN')
@@ -127,7 +195,7 @@ def get_spcs_status() -> str:
 def suspend_service():
     """Suspend SPCS service."""
     try:
-        session.sql(f"ALTER SERVICE {FULL_SERVICE_NAME} SUSPEND").collect()
+        session.sql(_SUSPEND_SQL).collect()
         return True, "Service suspended successfully!"
     except Exception as e:
         return False, f"Error: {str(e)}"
@@ -135,11 +203,54 @@ def suspend_service():
 def resume_service():
     """Resume SPCS service."""
     try:
-        session.sql(f"ALTER SERVICE {FULL_SERVICE_NAME} RESUME").collect()
+        session.sql(_RESUME_SQL).collect()
         return True, "Service resuming... (may take 20-30 seconds)"
     except Exception as e:
         return False, f"Error: {str(e)}"
 
+@st.cache_data(ttl=5, show_spinner=False)
+def _poll_status() -> str:
+    """Cached status poll: reruns within 5 s reuse the last value."""
+    return get_spcs_status()
+
+# Button callbacks: these run before the natural post-click rerun, so
+# updating session_state here is enough for the whole page to render
+# the new status - no extra st.rerun() pass needed.
+
+def _refresh_status():
+    """Bust the status cache so the next render re-polls."""
+    _poll_status.clear()
+    st.session_state.pop("service_status", None)
+
+def _suspend_callback():
+    """Suspend the service and record the new status in place."""
+    success, msg = suspend_service()
+    if success:
+        _poll_status.clear()
+        st.session_state["service_status"] = "SUSPENDED"
+    st.toast(msg, icon="✅" if success else "⚠️")
+
+def _resume_callback():
+    """Resume the service and record the new status in place."""
+    success, msg = resume_service()
+    if success:
+        _poll_status.clear()
+        st.session_state["service_status"] = "PENDING"
+    st.toast(msg, icon="✅" if success else "⚠️")
+
+_SERVICE_ACTIONS = {
+    "🔄 Refresh": _refresh_status,
+    "⏸️ Suspend": _suspend_callback,
+    "▶️ Resume": _resume_callback,
+}
+
+def _dispatch_service_action():
+    """Run the selected service action, then clear the selection."""
+    action = st.session_state.get("spcs_action")
+    if action:
+        _SERVICE_ACTIONS[action]()
+        st.session_state["spcs_action"] = None
+
 # ============================================================================
 # MAIN UI
 # ============================================================================
@@ -151,7 +262,13 @@ st.markdown("**SPCS-Powered Inference** | Sub-300ms Latency | Full MLOps")
 col1, col2, col3, col4 = st.columns(4)
 
 with col1:
-    status = get_spcs_status()
+    # A one-shot status override written by the action callbacks takes
+    # priority (Snowflake may not reflect the transition yet); every
+    # other rerun is served by the short-TTL cached poll. Read without
+    # consuming - the Explorer fragment below always runs after this
+    # and is the single place that clears the override, so both
+    # sections show the same status within a frame.
+    status = st.session_state.get("service_status") or _poll_status()
     if status == "READY":
         status_display = "🟢 READY"
     elif status == "PENDING":
@@ -178,22 +295,14 @@ st.sidebar.header("🎛️ SPCS Controls")
 st.sidebar.markdown(f"**Service:** `{FULL_SERVICE_NAME}`")
 st.sidebar.markdown(f"**Status:** {status}")
 
+# Toast feedback survives the natural post-click rerun, unlike the old
+# banner + st.rerun() pair that threw away the frame holding the banner
 if status == "READY":
-    if st.sidebar.button("⏸️ Suspend Service", use_container_width=True):
-        success, msg = suspend_service()
-        if success:
-            st.sidebar.success(msg)
-            st.rerun()
-        else:
-            st.sidebar.error(msg)
+    st.sidebar.button("⏸️ Suspend Service", use_container_width=True,
+                      on_click=_suspend_callback)
 elif status in ["SUSPENDED", "NOT_DEPLOYED", "UNAVAILABLE"]:
-    if st.sidebar.button("▶️ Resume Service", use_container_width=True):
-        success, msg = resume_service()
-        if success:
-            st.sidebar.info(msg)
-            st.rerun()
-        else:
-            st.sidebar.error(msg)
+    st.sidebar.button("▶️ Resume Service", use_container_width=True,
+                      on_click=_resume_callback)
 else:
     st.sidebar.info("Service is starting...")
 
@@ -310,130 +419,123 @@ with col2:
 st.markdown("---")
 st.header("📊 MLOps Explorer")
 
-tab1, tab2, tab3 = st.tabs(["Feature Store", "Predictions", "SPCS Controls"])
-
-with tab1:
-    st.subheader("Online Feature Store")
-    st.caption(f"Table: `{FEATURE_TABLE}`")
-    
-    try:
-        features = session.sql(f"""
-            SELECT POLICY_NUMBER, COMBINED_RISK_SCORE, HAS_MIB_DATA, HAS_RX_DATA, 
-                   FEATURE_CREATED_AT
-            FROM {FEATURE_TABLE}
-            ORDER BY FEATURE_CREATED_AT DESC
-            LIMIT 10
-        """).collect()
+# Interactions inside the Explorer (view switch, slider, service
+# buttons) rerun only this fragment, and interactions elsewhere on
+# the page leave it untouched entirely.
+@st.fragment
+def _explorer():
+    # Re-resolve status here: fragment-only reruns never pass through
+    # the top-of-page poll. This is the one place the one-shot override
+    # is consumed - it runs last in a full frame and first in a
+    # fragment-only rerun, so the override covers exactly one frame and
+    # the top of the page never races it.
+    status = st.session_state.pop("service_status", None) or _poll_status()
+
+    # st.tabs renders every tab body on each rerun, so all Explorer SQL
+    # would fire even when the user only wants the service controls. A
+    # radio runs just the selected view; switching back within the cache
+    # TTL is served from memory.
+    # The row cap is an explicit widget rather than a hard-coded LIMIT so
+    # raising it stays a bounded, deliberate act - st.cache_data keys on it
+    explorer_rows = st.slider("Rows to show", 10, 1000, 10, key="explorer_n")
+
+    explorer_view = st.radio(
+        "View", ["Feature Store", "Predictions", "SPCS Controls"],
+        horizontal=True, label_visibility="collapsed")
+
+    if explorer_view == "Feature Store":
+        st.subheader("Online Feature Store")
+        st.caption(f"Table: `{FEATURE_TABLE}`")
         
-        if features:
-            import pandas as pd
-            df = pd.DataFrame([{
-                "Policy": r[0],
-                "Risk Score": f"{r[1]:.3f}" if r[1] else "N/A",
-                "MIB": "✅" if r[2] else "❌",
-                "RX": "✅" if r[3] else "❌",
-                "Created": r[4].strftime("%H:%M:%S") if r[4] else "N/A"
-            } for r in features])
-            st.dataframe(df, use_container_width=True)
-        else:
-            st.info("No features stored yet. Run inference with MLOps mode.")
-    except Exception as e:
-        st.warning(f"Could not load features: {str(e)}")
-        st.caption("Make sure the FEATURE_STORE.ONLINE_FEATURES table exists.")
+        try:
+            features, _ = _load_explorer(explorer_rows)
+
+            if not features.empty:
+                df = features[["POLICY_NUMBER", "SCORE", "HAS_MIB_DATA",
+                               "HAS_RX_DATA", "CREATED_AT"]].rename(
+                    columns={"POLICY_NUMBER": "Policy", "SCORE": "Risk Score",
+                             "HAS_MIB_DATA": "MIB", "HAS_RX_DATA": "RX",
+                             "CREATED_AT": "Created"})
+                # Raw types go to the browser; column_config formats there
+                # and keeps numeric/time sorting intact. Fixed viewport so
+                # the DOM stays small however many rows load.
+                st.dataframe(
+                    df, use_container_width=True,
+                    height=min(35 * len(df) + 38, 400),
+                    column_config={
+                        "Risk Score": st.column_config.NumberColumn(format="%.3f"),
+                        "MIB": st.column_config.CheckboxColumn(),
+                        "RX": st.column_config.CheckboxColumn(),
+                        "Created": st.column_config.DatetimeColumn(format="HH:mm:ss"),
+                    })
+            else:
+                st.info("No features stored yet. Run inference with MLOps mode.")
+        except Exception as e:
+            st.warning(f"Could not load features: {str(e)}")
+            st.caption("Make sure the FEATURE_STORE.ONLINE_FEATURES table exists.")
+
+    elif explorer_view == "Predictions":
+        st.subheader("Model Predictions")
+        st.caption(f"Table: `{PREDICTIONS_TABLE}`")
+        
+        try:
+            _, predictions = _load_explorer(explorer_rows)
+
+            if not predictions.empty:
+                df = predictions[["POLICY_NUMBER", "SCORE", "PREDICTION_CLASS",
+                                  "MODEL_VERSION", "CREATED_AT"]].rename(
+                    columns={"POLICY_NUMBER": "Policy", "SCORE": "Score",
+                             "PREDICTION_CLASS": "Level", "MODEL_VERSION": "Model",
+                             "CREATED_AT": "Created"})
+                # Raw types go to the browser; column_config formats there
+                # and keeps numeric/time sorting intact. Fixed viewport so
+                # the DOM stays small however many rows load.
+                st.dataframe(
+                    df, use_container_width=True,
+                    height=min(35 * len(df) + 38, 400),
+                    column_config={
+                        "Score": st.column_config.NumberColumn(format="%.3f"),
+                        "Created": st.column_config.DatetimeColumn(format="HH:mm:ss"),
+                    })
+            else:
+                st.info("No predictions stored yet. Run inference with MLOps mode.")
+        except Exception as e:
+            st.warning(f"Could not load predictions: {str(e)}")
+            st.caption("Make sure the ML_MODELS.MODEL_PREDICTIONS table exists.")
 
-with tab2:
-    st.subheader("Model Predictions")
-    st.caption(f"Table: `{PREDICTIONS_TABLE}`")
-    
-    try:
-        predictions = session.sql(f"""
-            SELECT POLICY_NUMBER, PREDICTION, PREDICTION_CLASS, MODEL_VERSION, CREATED_AT
-            FROM {PREDICTIONS_TABLE}
-            ORDER BY CREATED_AT DESC
-            LIMIT 10
-        """).collect()
+    else:
+        st.subheader("SPCS Service Controls")
         
-        if predictions:
-            import pandas as pd
-            df = pd.DataFrame([{
-                "Policy": r[0],
-                "Score": f"{r[1]:.3f}" if r[1] else "N/A",
-                "Level": r[2] or "N/A",
-                "Model": r[3] or "N/A",
-                "Created": r[4].strftime("%H:%M:%S") if r[4] else "N/A"
-            } for r in predictions])
-            st.dataframe(df, use_container_width=True)
-        else:
-            st.info("No predictions stored yet. Run inference with MLOps mode.")
-    except Exception as e:
-        st.warning(f"Could not load predictions: {str(e)}")
-        st.caption("Make sure the ML_MODELS.MODEL_PREDICTIONS table exists.")
+        # Native table component: no markdown parsing on the rerun-heavy
+        # Suspend/Resume/Refresh path
+        st.table({
+            "Setting": ["Service Name", "Current Status"],
+            "Value": [FULL_SERVICE_NAME, status],
+        })
+        
+        # One segmented control replaces the three columned buttons;
+        # actions that do not apply to the current status are omitted
+        # from the options instead of rendered disabled
+        options = ["🔄 Refresh"]
+        if status == "READY":
+            options.append("⏸️ Suspend")
+        elif status != "PENDING":
+            options.append("▶️ Resume")
+        st.segmented_control(
+            "SPCS Action", options, selection_mode="single",
+            key="spcs_action", on_change=_dispatch_service_action,
+            label_visibility="collapsed")
+        
+        st.markdown("---")
+        
+        st.markdown(_SPCS_TIPS_MD)
 
-with tab3:
-    st.subheader("SPCS Service Controls")
-    
-    st.markdown(f"""
-    | Setting | Value |
-    |---------|-------|
-    | Service Name | `{FULL_SERVICE_NAME}` |
-    | Current Status | **{status}** |
-    """)
-    
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        if st.button("🔄 Refresh Status", use_container_width=True):
-            st.rerun()
-    
-    with col2:
-        suspend_disabled = status != "READY"
-        if st.button("⏸️ Suspend", disabled=suspend_disabled, use_container_width=True):
-            success, msg = suspend_service()
-            if success:
-                st.success(msg)
-                st.rerun()
-            else:
-                st.error(msg)
-    
-    with col3:
-        resume_disabled = status == "READY" or status == "PENDING"
-        if st.button("▶️ Resume", disabled=resume_disabled, use_container_width=True):
-            success, msg = resume_service()
-            if success:
-                st.info(msg)
-                st.rerun()
-            else:
-                st.error(msg)
-    
-    st.markdown("---")
-    
-    st.markdown("""
-    ### 💡 Tips
-    - **Suspend** when not using to save costs
-    - **Resume** takes 20-30 seconds to start
-    - Service auto-scales between MIN and MAX instances
-    
-    ### 📊 Monitoring Commands (run in Snowsight)
-    ```sql
-    -- Check service status
-    CALL SYSTEM$GET_SERVICE_STATUS('ML_MODELS.INFERENCE_SERVICE');
-    
-    -- View service logs
-    CALL SYSTEM$GET_SERVICE_LOGS('ML_MODELS.INFERENCE_SERVICE', 0, 'api', 100);
-    
-    -- Check endpoints
-    SHOW ENDPOINTS IN SERVICE ML_MODELS.INFERENCE_SERVICE;
-    ```
-    """)
+_explorer()
 
 # ============================================================================
 # FOOTER
 # ============================================================================
 
-st.markdown("---")
-st.markdown("""
-<div style='text-align: center; color: #888;'>
-    Real-Time ML Pipeline | SPCS + Feature Store + Model Registry<br>
-    <small>Internal DNS: ~17ms inference | Total: ~300ms</small>
-</div>
-""", unsafe_allow_html=True)
+st.divider()
+st.caption("Real-Time ML Pipeline | SPCS + Feature Store + Model Registry")
+st.caption("Internal DNS: ~17ms inference | Total: ~300ms")